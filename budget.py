@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import threading
+from datetime import date
+
+# --- BUDGET SETTINGS (None disables a limit) ---
+RUN_COST_LIMIT = None  # USD spent by this run
+RUN_TOKEN_LIMIT = None  # tokens billed to this run
+DAILY_COST_LIMIT = 20.00  # USD spent today, across runs
+DAILY_TOKEN_LIMIT = None  # tokens billed today, across runs
+THROTTLE_AT = 0.9  # fraction of any limit after which workers slow down
+THROTTLE_DELAY = 10  # extra seconds between calls once throttling
+
+# Gemini 3 Flash prices in USD per 1M tokens
+INPUT_PRICE = 0.50
+CACHED_INPUT_PRICE = 0.05
+OUTPUT_PRICE = 3.00
+CACHE_STORAGE_PRICE = 1.00  # per 1M cached tokens per hour the cache is kept alive
+# -----------------------------------------------
+
+BUDGET_STATE = os.path.join("output", "budget_state.json")
+SAVE_INTERVAL = 30  # seconds between writes of the state file
+
+COUNTER_KEYS = [
+    "calls",
+    "prompt_tokens",
+    "cached_tokens",
+    "output_tokens",
+    "total_tokens",
+    "storage_cost",
+    "cost",
+]
+
+
+def empty_counters():
+    return {key: 0 for key in COUNTER_KEYS}
+
+
+def add_counters(target, source):
+    for key in COUNTER_KEYS:
+        target[key] = target.get(key, 0) + source.get(key, 0)
+
+
+def add_days(target, source):
+    for day, counters in source.items():
+        add_counters(target.setdefault(day, empty_counters()), counters)
+
+
+def read_state(state_path):
+    """Returns the (total, days) counters stored in state_path."""
+    total, days = empty_counters(), {}
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        add_counters(total, state.get("total", {}))
+        add_days(days, state.get("days", {}))
+    return total, days
+
+
+def usage_from_response(response):
+    """Reads the billed token counts from a Gemini response's usage_metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    prompt_tokens = usage.prompt_token_count or 0
+    cached_tokens = usage.cached_content_token_count or 0
+    # Thinking tokens are billed at the output rate
+    output_tokens = (usage.candidates_token_count or 0) + (
+        usage.thoughts_token_count or 0
+    )
+    total_tokens = usage.total_token_count or (prompt_tokens + output_tokens)
+    cost = (
+        (prompt_tokens - cached_tokens) * INPUT_PRICE
+        + cached_tokens * CACHED_INPUT_PRICE
+        + output_tokens * OUTPUT_PRICE
+    ) / 1_000_000
+    return {
+        "calls": 1,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "storage_cost": 0,
+        "cost": cost,
+    }
+
+
+class Budget:
+    def __init__(self, state_path=BUDGET_STATE):
+        """Loads the cumulative and per-day counters persisted by earlier runs."""
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.last_save = time.monotonic()
+        self.run = empty_counters()
+        self.total, self.days = read_state(state_path)
+        # Usage recorded since the last save, merged into the file on save
+        self.pending_total = empty_counters()
+        self.pending_days = {}
+
+    def today(self):
+        return self.days.setdefault(date.today().isoformat(), empty_counters())
+
+    def record(self, response):
+        """Adds a response's usage to the run, daily and lifetime counters."""
+        usage = usage_from_response(response)
+        if usage is not None:
+            self.add(usage)
+
+    def record_storage(self, tokens, seconds):
+        """Charges keeping `tokens` in a server-side cache for `seconds`."""
+        storage_cost = tokens * CACHE_STORAGE_PRICE * seconds / 3600 / 1_000_000
+        usage = empty_counters()
+        usage["storage_cost"] = usage["cost"] = storage_cost
+        self.add(usage)
+
+    def add(self, usage):
+        with self.lock:
+            day = date.today().isoformat()
+            pending_today = self.pending_days.setdefault(day, empty_counters())
+            for counters in (self.run, self.today(), self.total):
+                add_counters(counters, usage)
+            for counters in (self.pending_total, pending_today):
+                add_counters(counters, usage)
+            due = time.monotonic() - self.last_save >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        """
+        Merges the usage recorded since the last save into the state file,
+        so a concurrent run (e.g. main.py and rerun.py) keeps its spend too,
+        and writes it atomically so an interrupted run never corrupts it.
+        A failed save is reported and its usage is kept for the next one; it
+        never reaches the caller, whose response has already been billed.
+        """
+        tmp_path = self.state_path + ".tmp"
+        with self.save_lock:
+            with self.lock:
+                pending_total, pending_days = self.pending_total, self.pending_days
+                self.pending_total, self.pending_days = empty_counters(), {}
+                self.last_save = time.monotonic()
+            try:
+                total, days = read_state(self.state_path)
+                add_counters(total, pending_total)
+                add_days(days, pending_days)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"total": total, "days": days}, f, indent=2)
+                os.replace(tmp_path, self.state_path)
+            except (OSError, ValueError) as e:
+                print(f"\nCould not save budget state to {self.state_path}: {e}")
+                with self.lock:
+                    add_counters(self.pending_total, pending_total)
+                    add_days(self.pending_days, pending_days)
+                return
+            with self.lock:
+                # Pick up other runs' spend, plus anything recorded meanwhile
+                add_counters(total, self.pending_total)
+                add_days(days, self.pending_days)
+                self.total, self.days = total, days
+
+    def usage_fractions(self):
+        """Returns how much of each enabled limit has been used, keyed by name."""
+        today = self.today()
+        limits = [
+            ("run cost", self.run["cost"], RUN_COST_LIMIT),
+            ("run tokens", self.run["total_tokens"], RUN_TOKEN_LIMIT),
+            ("daily cost", today["cost"], DAILY_COST_LIMIT),
+            ("daily tokens", today["total_tokens"], DAILY_TOKEN_LIMIT),
+        ]
+        # A limit of 0 means spend nothing, so it counts as already used up
+        return {
+            name: used / limit if limit else float("inf")
+            for name, used, limit in limits
+            if limit is not None
+        }
+
+    def exceeded(self):
+        """Returns the name of the first exhausted limit, or None."""
+        with self.lock:
+            for name, fraction in self.usage_fractions().items():
+                if fraction >= 1:
+                    return name
+        return None
+
+    def throttle_delay(self):
+        """Extra seconds to wait per call once any limit passes THROTTLE_AT."""
+        with self.lock:
+            fractions = self.usage_fractions().values()
+        if any(fraction >= THROTTLE_AT for fraction in fractions):
+            return THROTTLE_DELAY
+        return 0
+
+    def summary(self):
+        with self.lock:
+            today = self.today()
+            cached = self.run["cached_tokens"]
+            input_saved = cached * (INPUT_PRICE - CACHED_INPUT_PRICE) / 1_000_000
+            storage = self.run["storage_cost"]
+            return (
+                f"This run: {self.run['calls']} billed calls, "
+                f"{self.run['total_tokens']:,} tokens, ${self.run['cost']:.4f}. "
+                f"Cached prompt tokens: {cached:,} (input savings "
+                f"${input_saved:.4f}, cache storage ${storage:.4f}, "
+                f"net ${input_saved - storage:.4f}). "
+                f"Today: ${today['cost']:.4f}. All time: ${self.total['cost']:.4f}."
+            )
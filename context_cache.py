@@ -0,0 +1,146 @@
+import time
+import threading
+from google.genai import errors, types
+
+CACHE_TTL = 900  # seconds a cached context lives after its last refresh
+REFRESH_MARGIN = 300  # refresh the TTL once less than this is left
+RETRY_DELAY = 30  # first wait after a failed create/refresh, doubled per failure
+MAX_RETRY_DELAY = 600
+MIN_CACHE_TOKENS = 1024  # Gemini's minimum size for an explicit cached context
+CHARS_PER_TOKEN = 4  # rough English text estimate, no API call needed
+
+
+def is_permanent(error):
+    """Client errors (e.g. 400, prompt too small) will fail again; 429 and 5xx may not."""
+    return isinstance(error, errors.ClientError) and error.code != 429
+
+
+class PromptCache:
+    """
+    Registers the static prompt once as a server-side cached context and
+    hands out per-card requests that only carry the image.
+
+    The response schema is part of the generation config rather than the
+    cached contents, so it is serialized into a GenerateContentConfig once
+    and that object is reused for every call.
+
+    A prompt estimated below MIN_CACHE_TOKENS is never sent to
+    caches.create, which would only refuse it; requests then carry the
+    prompt inline, exactly as before. The same fallback is used if the
+    backend refuses the cache with a client error. Server and network
+    errors are retried with a backoff, and the calls are made outside the
+    lock so workers never queue behind them.
+
+    Cache storage is billed per token per hour it is kept alive, so every
+    create or TTL extension is charged to the budget passed to request().
+    """
+
+    def __init__(
+        self,
+        model,
+        prompt,
+        response_schema,
+        ttl=CACHE_TTL,
+        refresh_margin=REFRESH_MARGIN,
+        clock=time.monotonic,
+        min_tokens=MIN_CACHE_TOKENS,
+    ):
+        self.model = model
+        self.prompt = prompt
+        self.response_schema = response_schema
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.cache_name = None
+        self.expires_at = 0
+        # Too small to cache: skip the doomed create call and its warning
+        self.disabled = len(prompt) // CHARS_PER_TOKEN < min_tokens
+        self.busy = False  # a create/refresh call is in flight
+        self.retry_at = 0
+        self.retry_delay = RETRY_DELAY
+        self.cached_tokens = len(prompt) // CHARS_PER_TOKEN
+        self.inline_config = self.build_config()
+        self.cached_config = None
+
+    def build_config(self, cache_name=None):
+        return types.GenerateContentConfig(
+            cached_content=cache_name,
+            response_mime_type="application/json",
+            response_schema=self.response_schema,
+        )
+
+    def request(self, client, image_bytes, budget=None):
+        """Returns the (contents, config) pair for one card."""
+        image = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+        if self.ensure_cache(client, budget):
+            return [types.Content(role="user", parts=[image])], self.cached_config
+        return [
+            types.Content(parts=[types.Part(text=self.prompt), image])
+        ], self.inline_config
+
+    def ensure_cache(self, client, budget=None):
+        """Creates the cached context or extends its TTL when it is about to expire."""
+        with self.lock:
+            if self.disabled:
+                return False
+            now = self.clock()
+            alive = self.cache_name is not None and now < self.expires_at
+            fresh = alive and now < self.expires_at - self.refresh_margin
+            if fresh or self.busy or now < self.retry_at:
+                return alive
+            self.busy = True
+            name = self.cache_name if alive else None
+            paid_until = self.expires_at if alive else now
+
+        try:
+            if name:
+                client.caches.update(
+                    name=name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+                )
+            else:
+                name = self.create(client)
+        except Exception as e:
+            with self.lock:
+                self.busy = False
+                if not is_permanent(e):
+                    self.retry_at = now + self.retry_delay
+                    self.retry_delay = min(self.retry_delay * 2, MAX_RETRY_DELAY)
+                    return alive
+                if alive:
+                    # The server no longer has it, create a new one on the next call
+                    self.cache_name = None
+                    return False
+                print(f"\nPrompt caching unavailable, sending prompt inline: {e}")
+                self.disabled = True
+                return False
+
+        with self.lock:
+            self.busy = False
+            self.retry_at = 0
+            self.retry_delay = RETRY_DELAY
+            if name != self.cache_name:
+                self.cache_name = name
+                self.cached_config = self.build_config(name)
+            self.expires_at = now + self.ttl
+        if budget is not None:
+            budget.record_storage(self.cached_tokens, now + self.ttl - paid_until)
+        return True
+
+    def create(self, client):
+        """Registers the prompt as a cached context and returns its name."""
+        cache = client.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name="nurse-cadet-prompt",
+                contents=[
+                    types.Content(role="user", parts=[types.Part(text=self.prompt)])
+                ],
+                ttl=f"{self.ttl}s",
+            ),
+        )
+        usage = getattr(cache, "usage_metadata", None)
+        if usage is not None and usage.total_token_count:
+            self.cached_tokens = usage.total_token_count
+        return cache.name
@@ -1,6 +1,7 @@
 import os
 import csv
 import time
+import atexit
 import threading
 import json
 import io
@@ -9,10 +10,12 @@ from queue import Queue, Empty
 from tqdm import tqdm
 from PIL import Image
 from google import genai
-from google.genai import types
 from save import save_data
 import constants
 from nurse import NurseCadet
+from budget import Budget
+from processed_cache import ProcessedSet, normalize
+from context_cache import PromptCache
 
 # --- NEW GLOBAL TRACKING ---
 CALL_LIMIT = 10000
@@ -21,27 +24,31 @@ count_lock = threading.Lock()
 stop_event = threading.Event()
 # ---------------------------
 
+MODEL = "gemini-3-flash-preview"
 RPM_LIMIT = 50
 COOLDOWN = 5
 
-cache_lock = threading.Lock()
 error_lock = threading.Lock()
 
 
 def process(base_path):
+    budget = Budget()
+    atexit.register(budget.save)
     master_cache = load_processed_cache()
     unprocessed_folders = get_unprocessed_folders(base_path)
+    # Finish partially done folders first so spend turns into completed folders
+    unprocessed_folders = order_by_progress(unprocessed_folders, master_cache)
     for folder in unprocessed_folders:
         if stop_event.is_set():
-            print(f"\nLimit of {CALL_LIMIT} calls reached. Exiting.")
+            print(f"\nCall or budget limit reached. Exiting.\n{budget.summary()}")
             sys.exit(0)
-        error = process_folder(folder, master_cache)
+        error = process_folder(folder, master_cache, budget)
         if error == 0:
             mark_folder_processed(folder)
     return
 
 
-def process_folder(folder_path, cache_set):
+def process_folder(folder_path, cache_set, budget):
     paths = get_image_paths(folder_path)
     if len(paths) == 0:
         return -1
@@ -66,7 +73,6 @@ def process_folder(folder_path, cache_set):
                 break
 
             start_time = time.time()
-            filename = os.path.basename(path)
 
             if already_processed(path, cache_set):
                 log_error(path, "File already processed")
@@ -74,19 +80,19 @@ def process_folder(folder_path, cache_set):
                 path_queue.task_done()
                 continue
 
-            nurse = worker_task(path, client)
+            nurse = worker_task(path, client, budget)
 
             if nurse:
                 with save_lock:
                     nurses.append(nurse)
-                    mark_file_done(filename, cache_set)
+                    mark_file_done(path, cache_set)
                     if len(nurses) >= constants.MAX_NURSES_TO_SAVE:
                         save_data(nurses)
                         nurses.clear()
 
             pbar.update(1)
             elapsed = time.time() - start_time
-            wait_time = max(0, COOLDOWN - elapsed)
+            wait_time = max(0, COOLDOWN + budget.throttle_delay() - elapsed)
 
             if not path_queue.empty() and not stop_event.is_set():
                 time.sleep(wait_time)
@@ -107,23 +113,30 @@ def process_folder(folder_path, cache_set):
     pbar.close()
     if stop_event.is_set():
         print(
-            f"\nTarget of {CALL_LIMIT} LLM calls reached. Data saved. Exiting script."
+            f"\nCall or budget limit reached. Data saved. Exiting script.\n"
+            f"{budget.summary()}"
         )
         sys.exit(0)
     return 0
 
 
-def worker_task(path, client):
+def worker_task(path, client, budget):
     # Check limit before calling LLM
     global llm_call_count
     with count_lock:
         if llm_call_count >= CALL_LIMIT:
             stop_event.set()
             return None
+        exceeded = budget.exceeded()
+        if exceeded:
+            if not stop_event.is_set():
+                print(f"\nBudget limit reached ({exceeded}).")
+            stop_event.set()
+            return None
         # Increment here ensures we count every attempt
         llm_call_count += 1
 
-    nurse, error_msg = extract_data(client, path)
+    nurse, error_msg = extract_data(client, path, budget)
     if nurse:
         is_blank = (
             not nurse.first_name and not nurse.serial_number and not nurse.last_name
@@ -141,14 +154,15 @@ def worker_task(path, client):
         return None
 
 
-def extract_data(client, path):
+def extract_data(client, path, budget):
     try:
         with open(path, "rb") as f:
             image_bytes = f.read()
         image_bytes = reduce_resolution(image_bytes, scale=0.5)
 
         # The actual LLM call
-        response = llm(image_bytes, client)
+        response = llm(image_bytes, client, budget)
+        budget.record(response)
 
         if not response or not response.text:
             return None, "Empty response from Gemini (Check safety filters)"
@@ -189,21 +203,14 @@ def get_image_paths(base_path):
     return jpg_files
 
 
-def llm(image_bytes, client: genai.Client):
+def llm(image_bytes, client: genai.Client, budget=None):
+    # Uses the server-side cached prompt when one is available, otherwise the
+    # prompt is sent inline with the image
+    contents, config = prompt_cache.request(client, image_bytes, budget)
     return client.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=[
-            types.Content(
-                parts=[
-                    types.Part(text=prompt),
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                ]
-            )
-        ],
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=NurseCadet.get_response_schema(),
-        ),
+        model=MODEL,
+        contents=contents,
+        config=config,
     )
 
 
@@ -251,6 +258,10 @@ BLANK CARDS or Irrelevant Photos:
  - If card is blank return null for everything.
 """
 
+# At ~400 tokens the prompt is below MIN_CACHE_TOKENS, so no cache is created and
+# the prompt is sent inline; the config is still built once and reused
+prompt_cache = PromptCache(MODEL, prompt, NurseCadet.get_response_schema())
+
 
 def get_unprocessed_folders(base_path):
     processed_names = set()
@@ -271,6 +282,24 @@ def get_unprocessed_folders(base_path):
     return full_paths
 
 
+def order_by_progress(folder_paths, cache_set):
+    """
+    Sorts folders so the ones with the most already processed files come
+    first. Files in subfolders count towards every folder above them, since
+    get_image_paths walks the whole tree. Folders that have not been started
+    keep their original order.
+    """
+    done_counts = {}
+    for directory, count in cache_set.directory_counts().items():
+        while directory:
+            done_counts[directory] = done_counts.get(directory, 0) + count
+            directory = directory.rpartition("/")[0]
+    return sorted(
+        folder_paths,
+        key=lambda p: -done_counts.get(normalize(p), 0),
+    )
+
+
 def mark_folder_processed(full_path):
     """
     Extracts the folder name from a full path, removes it from
@@ -291,32 +320,23 @@ def mark_folder_processed(full_path):
 
 
 def load_processed_cache():
-    """Initializes the set from the CSV once at startup."""
-    processed_set = set()
-    if os.path.exists(constants.NURSE_OUTPUT):
-        with open(constants.NURSE_OUTPUT, mode="r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                name = row.get("file")
-                if name:
-                    processed_set.add(name)
-    if os.path.exists(constants.ERRORS_OUTPUT):
-        with open(constants.ERRORS_OUTPUT, mode="r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                name = row.get("filename")
-                if name:
-                    processed_set.add(name)
-    return processed_set
+    """
+    Initializes the set from the CSVs once at startup. A snapshot is kept
+    next to the outputs so only rows appended since the last run are parsed.
+    """
+    return ProcessedSet.load(
+        [
+            (constants.NURSE_OUTPUT, "file"),
+            (constants.ERRORS_OUTPUT, "filename"),
+        ]
+    )
 
 
 def already_processed(filename, cache_set):
-    """Instant lookup in the thread-safe set."""
-    with cache_lock:
-        return filename in cache_set
+    """Lock-free lookup in the processed set."""
+    return filename in cache_set
 
 
 def mark_file_done(filename, cache_set):
-    """Updates both the shared set and the physical CSV file."""
-    with cache_lock:
-        cache_set.add(filename)
\ No newline at end of file
+    """Adds a finished file to the shared set."""
+    cache_set.add(filename)
\ No newline at end of file
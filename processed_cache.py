@@ -0,0 +1,279 @@
+import os
+import re
+import csv
+import pickle
+import hashlib
+import threading
+
+PROCESSED_SNAPSHOT = os.path.join("output", "processed_snapshot.pkl")
+SNAPSHOT_VERSION = 5
+FINGERPRINT_BLOCK = 1 << 16  # bytes hashed at the start and end of what was read
+
+# The archive's <prefix>-<5 digit sequence>.jpg, e.g. 32931_520305891_0307-00922.jpg.
+# Only this exact form is encoded, so F1-922.jpg or F1-00922.JPEG never share
+# a bit with F1-00922.jpg; any other name is kept as a plain string.
+SEQUENCE_PATTERN = re.compile(r"^(.+)-(\d{5})\.jpg$")
+
+
+def normalize(path):
+    return path.replace("\\", "/").rstrip("/")
+
+
+def split_path(path):
+    """
+    Encodes a card path as ((directory, prefix), sequence number), with the
+    directory normalized so the same card is matched whether the path was
+    written with / or \\. Returns None for file names not in the archive's
+    fixed-width form.
+    """
+    directory, _, name = normalize(path).rpartition("/")
+    match = SEQUENCE_PATTERN.match(name)
+    if not match:
+        return None
+    return (directory, match.group(1)), int(match.group(2))
+
+
+class ProcessedSet:
+    """
+    Membership set for processed card paths. Each (directory, prefix) pair owns
+    a bitmap indexed by image sequence number, so a folder of a few thousand
+    cards costs a few hundred bytes instead of one string per card.
+
+    Lookups do not take a lock: a bitmap only ever grows and setting a bit
+    is a single bytearray item assignment, so a reader sees either the old
+    or the new byte. Writers are serialized by write_lock.
+    """
+
+    def __init__(self):
+        self.bitmaps = {}
+        self.others = set()  # paths not in the archive's fixed-width form
+        self.write_lock = threading.Lock()
+
+    def __contains__(self, path):
+        encoded = split_path(path)
+        if encoded is None:
+            return path in self.others
+        key, seq = encoded
+        bitmap = self.bitmaps.get(key)
+        if bitmap is None or seq >> 3 >= len(bitmap):
+            return False
+        return bool(bitmap[seq >> 3] & (1 << (seq & 7)))
+
+    def add(self, path):
+        encoded = split_path(path)
+        with self.write_lock:
+            if encoded is None:
+                self.others.add(path)
+                return
+            key, seq = encoded
+            bitmap = self.bitmaps.get(key)
+            if bitmap is None:
+                bitmap = self.bitmaps[key] = bytearray()
+            if seq >> 3 >= len(bitmap):
+                bitmap.extend(bytes((seq >> 3) + 1 - len(bitmap)))
+            bitmap[seq >> 3] |= 1 << (seq & 7)
+
+    def directory_counts(self):
+        """Returns the number of processed files per normalized directory."""
+        counts = {}
+        for (directory, _), bitmap in list(self.bitmaps.items()):
+            bits = int.from_bytes(bitmap, "little").bit_count()
+            counts[directory] = counts.get(directory, 0) + bits
+        for path in list(self.others):
+            directory = normalize(path).rpartition("/")[0]
+            counts[directory] = counts.get(directory, 0) + 1
+        return counts
+
+    def add_csv(self, csv_path, column, offset=0, digest=None):
+        """
+        Adds every path in `column` of csv_path starting at byte `offset`
+        and returns the offset of the end of the last complete row. The
+        bytes consumed are fed to `digest`, so it ends up covering the file
+        up to the returned offset. The file is streamed a line at a time, so
+        memory stays flat however large the CSV is.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        with open(csv_path, "rb") as f:
+            header = f.readline()
+            if not header.endswith(b"\n"):
+                return 0
+            if digest is not None and offset < len(header):
+                digest.update(header)
+            end = max(offset, len(header))
+            fieldnames = next(csv.reader([header.decode("utf-8-sig")]), [])
+            if column not in fieldnames:
+                return end
+            index = fieldnames.index(column)
+            f.seek(end)
+
+            row_lines = []
+
+            def complete_lines():
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Partially written last row, read on the next load
+                        return
+                    row_lines.append(line)
+                    yield line.decode("utf-8")
+
+            try:
+                for row in csv.reader(complete_lines()):
+                    consumed = b"".join(row_lines)
+                    row_lines.clear()
+                    end += len(consumed)
+                    if digest is not None:
+                        digest.update(consumed)
+                    if len(row) > index and row[index]:
+                        self.add(row[index])
+            except csv.Error:
+                # A quoted row cut off by a partial write
+                pass
+        return end
+
+    def save(self, snapshot_path, sources):
+        """
+        Pickles the bitmaps along with how far each source CSV was read and
+        a fingerprint of the bytes read, so a rewritten CSV is detected.
+        """
+        tmp_path = snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "sources": sources,
+                    "bitmaps": {k: bytes(v) for k, v in self.bitmaps.items()},
+                    "others": self.others,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, snapshot_path)
+
+    @classmethod
+    def load(cls, csv_columns, snapshot_path=PROCESSED_SNAPSHOT):
+        """
+        Builds the set from a list of (csv_path, column) pairs. The snapshot
+        is reused when it was taken from the same CSVs and the bytes it
+        read are unchanged, i.e. the CSVs have only been appended to since;
+        then just the new rows are read. Otherwise it is rebuilt from scratch.
+        Checking the snapshot normally costs a stat and two small reads per
+        CSV, see source_unchanged.
+        """
+        processed = cls()
+        snapshot = None
+        if os.path.exists(snapshot_path):
+            try:
+                with open(snapshot_path, "rb") as f:
+                    snapshot = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                snapshot = None
+
+        stored = {}
+        if snapshot and snapshot.get("version") == SNAPSHOT_VERSION:
+            stored = snapshot["sources"]
+            if [path for path, _ in csv_columns] != list(stored):
+                stored = {}
+
+        if stored and all(
+            source_unchanged(path, stored[path]) for path, _ in csv_columns
+        ):
+            processed.bitmaps = {
+                k: bytearray(v) for k, v in snapshot["bitmaps"].items()
+            }
+            processed.others = snapshot["others"]
+        else:
+            stored = {}
+
+        sources = {}
+        for csv_path, column in csv_columns:
+            source = stored.get(csv_path, {"offset": 0, "segments": [], "chain": ""})
+            digest = hashlib.sha1()
+            end = processed.add_csv(csv_path, column, source["offset"], digest)
+            sources[csv_path] = fingerprint(csv_path, source, end, digest)
+        if sources != stored:
+            processed.save(snapshot_path, sources)
+        return processed
+
+
+def hash_range(f, start, stop, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    f.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def chain(previous, segment_digest):
+    """Folds one load's segment digest into the running hash of everything read."""
+    return hashlib.sha1((previous + segment_digest).encode()).hexdigest()
+
+
+def sample(csv_path, offset):
+    """Hashes the first and the last FINGERPRINT_BLOCK bytes before offset."""
+    with open(csv_path, "rb") as f:
+        head = hash_range(f, 0, min(offset, FINGERPRINT_BLOCK))
+        tail = hash_range(f, max(0, offset - FINGERPRINT_BLOCK), offset)
+    return head, tail
+
+
+def fingerprint(csv_path, source, end, digest):
+    """
+    Describes the first `end` bytes of csv_path after a load that read from
+    source["offset"] to `end`, feeding `digest` with those bytes. Besides the
+    size, mtime and sampled blocks, each load's bytes are kept as a segment
+    in a hash chain so the whole prefix can be verified when a sample check
+    is inconclusive.
+    """
+    segments, chained = source["segments"], source["chain"]
+    if end > source["offset"]:
+        segments = segments + [end]
+        chained = chain(chained, digest.hexdigest())
+    if end == 0:
+        return {"offset": 0, "segments": [], "chain": ""}
+    stat = os.stat(csv_path)
+    head, tail = sample(csv_path, end)
+    return {
+        "offset": end,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "head": head,
+        "tail": tail,
+        "segments": segments,
+        "chain": chained,
+    }
+
+
+def source_unchanged(csv_path, source):
+    """
+    Checks that the first source["offset"] bytes of csv_path are the ones
+    the snapshot read. An untouched file (same size and mtime) is accepted
+    without reading it; a file that grew is accepted when the sampled blocks
+    still match. Only a file that was modified without growing, e.g.
+    restored from a copy, has its whole prefix rehashed.
+    """
+    offset = source["offset"]
+    if offset == 0:
+        return True
+    if not os.path.exists(csv_path):
+        return False
+    stat = os.stat(csv_path)
+    if stat.st_size < offset:
+        return False
+    if stat.st_size == source["size"] and stat.st_mtime_ns == source["mtime"]:
+        return True
+    if sample(csv_path, offset) != (source["head"], source["tail"]):
+        return False
+    if stat.st_size > source["size"]:
+        return True
+    chained, start = "", 0
+    with open(csv_path, "rb") as f:
+        for stop in source["segments"]:
+            chained = chain(chained, hash_range(f, start, stop))
+            start = stop
+    return chained == source["chain"]
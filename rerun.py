@@ -1,6 +1,7 @@
 import os
 import csv
 import time
+import atexit
 import threading
 from queue import Queue, Empty
 from tqdm import tqdm
@@ -8,6 +9,7 @@ from google import genai
 import constants
 from process import worker_task, stop_event, COOLDOWN, RPM_LIMIT, CALL_LIMIT
 from save import save_data
+from budget import Budget
 
 
 def get_rerun_paths():
@@ -54,6 +56,9 @@ def main():
 
     print(f"Found {len(paths)} files to rerun.")
 
+    budget = Budget()
+    atexit.register(budget.save)
+
     client = genai.Client()
     path_queue = Queue()
     for p in paths:
@@ -72,8 +77,8 @@ def main():
 
             start_time = time.time()
 
-            # Reuses worker_task which handles constants.CALL_LIMIT and stop_event
-            nurse = worker_task(path, client)
+            # Reuses worker_task which handles CALL_LIMIT, the budget and stop_event
+            nurse = worker_task(path, client, budget)
 
             if nurse:
                 with save_lock:
@@ -84,7 +89,7 @@ def main():
 
             pbar.update(1)
             elapsed = time.time() - start_time
-            wait_time = max(0, COOLDOWN - elapsed)
+            wait_time = max(0, COOLDOWN + budget.throttle_delay() - elapsed)
 
             if not path_queue.empty() and not stop_event.is_set():
                 time.sleep(wait_time)
@@ -104,9 +109,10 @@ def main():
 
     pbar.close()
     if stop_event.is_set():
-        print(f"\nExecution stopped (Call limit of {CALL_LIMIT} reached).")
+        print(f"\nExecution stopped (Call limit of {CALL_LIMIT} or budget reached).")
     else:
         print(f"\nRerun complete.")
+    print(budget.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import pytest
+
+errors = pytest.importorskip("google.genai.errors")
+
+from context_cache import PromptCache, RETRY_DELAY
+
+
+class FakeCaches:
+    """Local stand-in for client.caches that records calls and can fail on demand."""
+
+    def __init__(self):
+        self.calls = []
+        self.create_errors = []
+        self.update_errors = []
+        self.created = 0
+
+    def create(self, model, config):
+        self.calls.append("create")
+        if self.create_errors:
+            raise self.create_errors.pop(0)
+        self.created += 1
+        return type("Cache", (), {"name": f"cachedContents/{self.created}"})()
+
+    def update(self, name, config):
+        self.calls.append(("update", name, config.ttl))
+        if self.update_errors:
+            raise self.update_errors.pop(0)
+
+
+class FakeClient:
+    def __init__(self):
+        self.caches = FakeCaches()
+
+
+class FakeBudget:
+    def __init__(self):
+        self.storage = []
+
+    def record_storage(self, tokens, seconds):
+        self.storage.append((tokens, seconds))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(clock):
+    return PromptCache("model", "PROMPT", {"type": "OBJECT"}, clock=clock, min_tokens=0)
+
+
+def server_error():
+    return errors.ServerError(503, {"error": {"status": "UNAVAILABLE"}})
+
+
+def client_error(code=400):
+    return errors.ClientError(code, {"error": {"status": "INVALID_ARGUMENT"}})
+
+
+def prompt_sent(contents):
+    return any(getattr(p, "text", None) == "PROMPT" for p in contents[0].parts)
+
+
+def test_creates_once_and_reuses_config():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+
+    contents, config = cache.request(client, b"card1")
+    _, config2 = cache.request(client, b"card2")
+
+    assert client.caches.calls == ["create"]
+    assert config.cached_content == "cachedContents/1"
+    assert config2 is config
+    assert not prompt_sent(contents)
+
+
+def test_refreshes_ttl_inside_margin():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+    cache.request(client, b"card")
+
+    clock.now = cache.ttl - cache.refresh_margin + 1
+    cache.request(client, b"card")
+
+    assert client.caches.calls[-1] == ("update", "cachedContents/1", f"{cache.ttl}s")
+    assert cache.expires_at == clock.now + cache.ttl
+
+
+def test_storage_is_charged_for_each_ttl_extension():
+    client, clock, budget = FakeClient(), FakeClock(), FakeBudget()
+    cache = make_cache(clock)
+    cache.request(client, b"card", budget)
+
+    clock.now = cache.ttl - cache.refresh_margin + 1
+    cache.request(client, b"card", budget)
+
+    tokens = cache.cached_tokens
+    assert budget.storage == [(tokens, cache.ttl), (tokens, clock.now)]
+
+
+def test_failed_refresh_backs_off_while_alive():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+    cache.request(client, b"card")
+    client.caches.update_errors = [server_error()]
+
+    clock.now = cache.ttl - cache.refresh_margin + 1
+    assert cache.request(client, b"card")[1].cached_content == "cachedContents/1"
+    calls = len(client.caches.calls)
+    cache.request(client, b"card")
+    assert len(client.caches.calls) == calls
+
+    clock.now += RETRY_DELAY
+    cache.request(client, b"card")
+    assert client.caches.calls[-1][0] == "update"
+
+
+def test_recreates_after_expiry():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+    cache.request(client, b"card")
+
+    clock.now = cache.ttl + 1
+    _, config = cache.request(client, b"card")
+
+    assert client.caches.calls == ["create", "create"]
+    assert config.cached_content == "cachedContents/2"
+
+
+def test_transient_create_error_is_retried():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+    client.caches.create_errors = [server_error()]
+
+    contents, config = cache.request(client, b"card")
+    assert config is cache.inline_config and prompt_sent(contents)
+
+    clock.now = RETRY_DELAY
+    _, config = cache.request(client, b"card")
+    assert config.cached_content == "cachedContents/1"
+
+
+def test_prompt_below_minimum_never_calls_create():
+    client = FakeClient()
+    cache = PromptCache("model", "PROMPT", {"type": "OBJECT"}, min_tokens=1024)
+
+    contents, config = cache.request(client, b"card")
+
+    assert config is cache.inline_config and prompt_sent(contents)
+    assert client.caches.calls == []
+
+
+def test_client_error_falls_back_inline_for_good():
+    client, clock = FakeClient(), FakeClock()
+    cache = make_cache(clock)
+    client.caches.create_errors = [client_error()]
+
+    contents, config = cache.request(client, b"card")
+    clock.now = 10 * cache.ttl
+    cache.request(client, b"card")
+
+    assert config is cache.inline_config and prompt_sent(contents)
+    assert client.caches.calls == ["create"]
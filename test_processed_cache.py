@@ -0,0 +1,85 @@
+from processed_cache import ProcessedSet
+
+
+def write_rows(path, rows, mode="w"):
+    with open(path, mode, newline="", encoding="utf-8") as f:
+        f.write("".join(row + "\r\n" for row in rows))
+
+
+def make_sources(tmp_path):
+    nurses = tmp_path / "nurses.csv"
+    errors = tmp_path / "errors.csv"
+    columns = [(str(nurses), "file"), (str(errors), "filename")]
+    return nurses, errors, columns, str(tmp_path / "snapshot.pkl")
+
+
+def test_appended_rows_are_read_on_top_of_the_snapshot(tmp_path):
+    nurses, errors, columns, snapshot = make_sources(tmp_path)
+    write_rows(nurses, ["x,file", r"a,D:\JPG\F1\F1-00001.jpg"])
+    write_rows(errors, ["filename,reason"])
+    ProcessedSet.load(columns, snapshot)
+
+    write_rows(nurses, [r"b,D:\JPG\F1\F1-00002.jpg"], mode="a")
+    write_rows(errors, [r"D:\JPG\F2\F2-00003.jpg,Blank Card"], mode="a")
+    processed = ProcessedSet.load(columns, snapshot)
+
+    assert r"D:\JPG\F1\F1-00001.jpg" in processed
+    assert r"D:\JPG\F1\F1-00002.jpg" in processed
+    assert r"D:\JPG\F2\F2-00003.jpg" in processed
+    assert r"D:\JPG\F1\F1-00004.jpg" not in processed
+
+
+def test_partial_last_row_is_deferred_to_the_next_load(tmp_path):
+    nurses, errors, columns, snapshot = make_sources(tmp_path)
+    write_rows(nurses, ["x,file", r"a,D:\JPG\F1\F1-00001.jpg"])
+    with open(nurses, "a", encoding="utf-8") as f:
+        f.write(r"b,D:\JPG\F1\F1-000")
+
+    processed = ProcessedSet.load(columns, snapshot)
+    assert r"D:\JPG\F1\F1-00001.jpg" in processed
+    assert r"D:\JPG\F1\F1-000" not in processed
+
+    with open(nurses, "a", encoding="utf-8") as f:
+        f.write("02.jpg\r\n")
+    processed = ProcessedSet.load(columns, snapshot)
+    assert r"D:\JPG\F1\F1-00002.jpg" in processed
+
+
+def test_rewritten_csv_forces_a_rebuild(tmp_path):
+    nurses, errors, columns, snapshot = make_sources(tmp_path)
+    write_rows(nurses, ["x,file", r"a,F1\F1-00922.jpg", r"b,F2\F2-00001.jpg"])
+    ProcessedSet.load(columns, snapshot)
+
+    # Different rows and a larger file, so an offset check alone would pass
+    write_rows(
+        nurses,
+        ["x,file", r"zzzzzzzzzzzzzzzz,F3\F3-00005.jpg", r"yyyyyyyyyyyy,F2\F2-00001.jpg"],
+    )
+    processed = ProcessedSet.load(columns, snapshot)
+
+    assert r"F3\F3-00005.jpg" in processed
+    assert r"F2\F2-00001.jpg" in processed
+    assert r"F1\F1-00922.jpg" not in processed
+
+
+def test_missing_csv_is_read_once_it_appears(tmp_path):
+    nurses, errors, columns, snapshot = make_sources(tmp_path)
+    write_rows(nurses, ["x,file", r"a,F1\F1-00001.jpg"])
+    ProcessedSet.load(columns, snapshot)
+
+    write_rows(errors, ["filename,reason", r"F2\F2-00002.jpg,Blank Card"])
+    processed = ProcessedSet.load(columns, snapshot)
+
+    assert r"F1\F1-00001.jpg" in processed
+    assert r"F2\F2-00002.jpg" in processed
+
+
+def test_names_outside_the_fixed_width_form_do_not_share_a_bit():
+    processed = ProcessedSet()
+    processed.add(r"D:\JPG\F1\F1-00922.jpg")
+
+    for path in [r"D:\JPG\F1\F1-922.jpg", r"D:\JPG\F1\F1-00922.jpeg"]:
+        assert path not in processed
+        processed.add(path)
+        assert path in processed
+    assert len(processed.bitmaps) == 1